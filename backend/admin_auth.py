@@ -0,0 +1,29 @@
+"""
+Token check for admin-only API endpoints.
+
+Set ADMIN_TOKEN in the environment and send it as `Authorization: Bearer <token>`
+or `X-Admin-Token: <token>`. Without ADMIN_TOKEN the endpoints are disabled.
+"""
+import hmac
+import os
+from functools import wraps
+
+from flask import request, jsonify  # type: ignore
+
+
+def admin_required(view):
+    """Reject the request unless it carries the configured admin token."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv("ADMIN_TOKEN")
+        if not expected:
+            return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN not configured)"}), 403
+
+        token = request.headers.get("X-Admin-Token", "")
+        auth = request.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            token = auth[len("Bearer "):]
+        if not hmac.compare_digest(token.encode(), expected.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,337 @@
+"""
+Admission control for the chat endpoints.
+
+Each client IP gets a token bucket, with a finer bucket per client/session id
+under it (kept in process, or in a local SQLite file shared by all workers when
+RATE_LIMIT_DB is set), and the number of chats running at once is capped. Requests that would wait longer than the frontend
+is willing to wait are rejected straight away with 429/503 and Retry-After.
+"""
+import ipaddress
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import request, jsonify, make_response  # type: ignore
+
+from tracing import log_event
+
+# Token bucket: sustained requests per second and burst size per client IP
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 1.0))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 10))
+
+# Finer bucket per client/session id under its IP, for clients sharing an address
+RATE_LIMIT_CLIENT_RATE = float(os.getenv("RATE_LIMIT_CLIENT_RATE", RATE_LIMIT_RATE))
+RATE_LIMIT_CLIENT_BURST = float(os.getenv("RATE_LIMIT_CLIENT_BURST", RATE_LIMIT_BURST))
+
+# Proxies (IPs or CIDRs, comma separated) whose X-Forwarded-For is trusted
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.getenv("TRUSTED_PROXIES", "").split(",") if proxy.strip()
+]
+
+# Typeahead fires on every keystroke, so suggestions get their own, larger bucket
+SUGGEST_RATE_LIMIT_RATE = float(os.getenv("SUGGEST_RATE_LIMIT_RATE", 10))
+SUGGEST_RATE_LIMIT_BURST = float(os.getenv("SUGGEST_RATE_LIMIT_BURST", 30))
+
+# /chat/batch is charged per unique message from its own per-IP bucket, which
+# must hold at least one full batch (BATCH_MAX_MESSAGES in app.py)
+BATCH_RATE_LIMIT_RATE = float(os.getenv("BATCH_RATE_LIMIT_RATE", 1.0))
+BATCH_RATE_LIMIT_BURST = float(os.getenv("BATCH_RATE_LIMIT_BURST", os.getenv("BATCH_MAX_MESSAGES", 200)))
+
+# Optional SQLite file shared by all workers on the host
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")
+
+# Global cap on chats being processed and on chats waiting for a slot
+MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", 16))
+MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 32))
+
+# Matches the 30 second timeout in frontend/src/utils/api.ts
+CLIENT_TIMEOUT = float(os.getenv("CHAT_CLIENT_TIMEOUT", 30))
+
+# Forget idle in-process buckets after this many seconds
+BUCKET_IDLE_TTL = 600
+
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by client."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Returns 0 on success, else seconds until allowed."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (cost - tokens) / self.rate if self.rate > 0 else float("inf")
+            self._sweep(now)
+        return retry_after
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < BUCKET_IDLE_TTL:
+            return
+        self._last_sweep = now
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated > BUCKET_IDLE_TTL:
+                del self._buckets[key]
+
+
+class SQLiteTokenBucketLimiter:
+    """Token buckets stored in a local SQLite file so all workers share limits."""
+
+    def __init__(self, path: str, rate: float, burst: float):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Returns 0 on success, else seconds until allowed."""
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / self.rate if self.rate > 0 else float("inf")
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of requests in flight with a bounded wait queue.
+    Keeps a moving average of service time so it can tell up front when a
+    queued request would not get a slot before the client gives up.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_service_time = 1.0
+        self._cond = threading.Condition()
+
+    def estimated_wait(self) -> float:
+        """Expected seconds until a newly queued request gets a slot."""
+        if self.in_flight < self.max_in_flight:
+            return 0.0
+        return (self.waiting + 1) * self.avg_service_time / self.max_in_flight
+
+    def acquire(self, timeout: float):
+        """
+        Wait for a slot. Returns None on success, else the number of seconds
+        the caller should suggest in Retry-After.
+        """
+        with self._cond:
+            if self.in_flight < self.max_in_flight and self.waiting == 0:
+                self.in_flight += 1
+                return None
+
+            # Past this point the client gives up before the request can finish
+            budget = timeout - self.avg_service_time
+            wait = self.estimated_wait()
+            if self.waiting >= self.max_queue or wait >= budget:
+                return max(1.0, wait)
+
+            deadline = time.monotonic() + budget
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return max(1.0, self.estimated_wait())
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self, service_time: float):
+        with self._cond:
+            self.in_flight -= 1
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_service_time": round(self.avg_service_time, 3),
+        }
+
+
+if RATE_LIMIT_DB:
+    rate_limiter = SQLiteTokenBucketLimiter(RATE_LIMIT_DB, RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+    client_rate_limiter = SQLiteTokenBucketLimiter(RATE_LIMIT_DB, RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST)
+    batch_rate_limiter = SQLiteTokenBucketLimiter(RATE_LIMIT_DB, BATCH_RATE_LIMIT_RATE, BATCH_RATE_LIMIT_BURST)
+else:
+    rate_limiter = TokenBucketLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+    client_rate_limiter = TokenBucketLimiter(RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST)
+    batch_rate_limiter = TokenBucketLimiter(BATCH_RATE_LIMIT_RATE, BATCH_RATE_LIMIT_BURST)
+
+concurrency_limiter = ConcurrencyLimiter(MAX_IN_FLIGHT, MAX_QUEUE)
+
+# Kept in process: a SQLite write per keystroke would cost more than the lookup
+suggest_rate_limiter = TokenBucketLimiter(SUGGEST_RATE_LIMIT_RATE, SUGGEST_RATE_LIMIT_BURST)
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_ip() -> str:
+    """
+    Address of the caller: the peer address, or the nearest X-Forwarded-For
+    hop that is not one of TRUSTED_PROXIES when the peer is a trusted proxy.
+    """
+    ip = request.remote_addr or "unknown"
+    if not _is_trusted_proxy(ip):
+        return ip
+    hops = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        ip = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return ip
+
+
+def client_key():
+    """Explicit client/session id of the caller, scoped to its IP, or None."""
+    client_id = request.headers.get("X-Client-Id")
+    if client_id:
+        return f"ip:{client_ip()}/client:{client_id}"
+    data = request.get_json(silent=True)
+    session_id = data.get("session_id") if isinstance(data, dict) else None
+    if session_id:
+        return f"ip:{client_ip()}/session:{session_id}"
+    return None
+
+
+def _reject(status: int, message: str, retry_after: float):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(int(math.ceil(min(retry_after, 3600))))
+    return response
+
+
+def _take_tokens(limiter, key: str, tokens: float) -> float:
+    try:
+        return limiter.acquire(key, tokens)
+    except Exception as e:
+        # Never fail a request because the shared limiter store is unavailable
+        log_event(logging.ERROR, "Rate limiter error", error=str(e))
+        return 0.0
+
+
+def rate_limited(limiter):
+    """
+    Route decorator applying only a per-IP token bucket, for cheap endpoints
+    that need their own limits and no global in-flight cap.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            retry_after = _take_tokens(limiter, f"ip:{client_ip()}", 1.0)
+            if retry_after > 0:
+                return _reject(429, "Too many requests. Please slow down.", retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def admission_controlled(cost=1.0, limiter=None, scope=""):
+    """
+    Route decorator applying per-client rate limits and the global in-flight
+    cap. `cost` may be a number or a callable returning the tokens a request
+    should consume (e.g. the number of messages in a batch). A `limiter`
+    replaces the /chat buckets with a per-IP bucket of its own; give it a
+    `scope` so its keys cannot clash with /chat buckets in RATE_LIMIT_DB.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tokens = cost() if callable(cost) else cost
+            burst = limiter.burst if limiter else min(RATE_LIMIT_BURST, RATE_LIMIT_CLIENT_BURST)
+            if tokens > burst:
+                # Could never be admitted; waiting would not help
+                response = jsonify({"error": "Request is larger than the rate limit allows. Split it up."})
+                response.status_code = 413
+                return response
+
+            if limiter:
+                retry_after = _take_tokens(limiter, f"{scope}/ip:{client_ip()}", tokens)
+            else:
+                retry_after = _take_tokens(rate_limiter, f"ip:{client_ip()}", tokens)
+                key = client_key()
+                if retry_after <= 0 and key:
+                    retry_after = _take_tokens(client_rate_limiter, key, tokens)
+            if retry_after > 0:
+                return _reject(429, "Too many requests. Please slow down.", retry_after)
+
+            retry_after = concurrency_limiter.acquire(CLIENT_TIMEOUT)
+            if retry_after is not None:
+                return _reject(503, "The assistant is busy right now. Please try again shortly.", retry_after)
+
+            started = time.monotonic()
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                concurrency_limiter.release(time.monotonic() - started)
+                raise
+            if response.is_streamed:
+                # Hold the slot until the streamed body has been sent
+                response.call_on_close(lambda: concurrency_limiter.release(time.monotonic() - started))
+            else:
+                concurrency_limiter.release(time.monotonic() - started)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,132 @@
+"""
+Stale-while-revalidate cache for generated answers.
+
+Answers are keyed by the question as asked (casefolded, punctuation and extra
+whitespace dropped) and the knowledge base version. The spell-corrected text
+used for retrieval is not used: it maps different questions, and the same
+question in different languages, onto one answer.
+
+Within ANSWER_CACHE_TTL an entry is fresh and served as is. After that, and up
+to ANSWER_CACHE_MAX_STALE, it is still served immediately while a single
+background refresh asks Gemini again. When Gemini fails, entries up to
+ANSWER_CACHE_STALE_IF_ERROR old are served instead of an error message.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from query_normalizer import words
+from tracing import log_event
+
+# Seconds an answer is served without revalidation
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+
+# Seconds past expiry an answer is still served while it is being refreshed
+ANSWER_CACHE_MAX_STALE = float(os.getenv("ANSWER_CACHE_MAX_STALE", 86400))
+
+# Seconds past expiry an answer is served when Gemini is failing
+ANSWER_CACHE_STALE_IF_ERROR = float(os.getenv("ANSWER_CACHE_STALE_IF_ERROR", 7 * 86400))
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 5000))
+
+# After a failed background refresh, wait this long before trying again
+REFRESH_BACKOFF = float(os.getenv("ANSWER_CACHE_REFRESH_BACKOFF", 30))
+
+REFRESH_WORKERS = int(os.getenv("ANSWER_CACHE_REFRESH_WORKERS", 2))
+
+
+class _Entry:
+    __slots__ = ("value", "stored_at", "retry_at")
+
+    def __init__(self, value, stored_at: float):
+        self.value = value
+        self.stored_at = stored_at
+        self.retry_at = 0.0
+
+
+class AnswerCache:
+    """In-process LRU of generated answers with stale-while-revalidate."""
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_stale=ANSWER_CACHE_MAX_STALE,
+                 stale_if_error=ANSWER_CACHE_STALE_IF_ERROR, max_size=ANSWER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.stale_if_error = stale_if_error
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="answer-refresh")
+
+    @staticmethod
+    def key(query: str, version) -> tuple:
+        return (version, " ".join(words(query)))
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, stored_at: float = None):
+        with self._lock:
+            self._entries[key] = _Entry(value, time.time() if stored_at is None else stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _freshness(self, status: str, entry: _Entry = None) -> dict:
+        age = round(time.time() - entry.stored_at, 1) if entry else 0.0
+        return {"status": status, "age": age, "ttl": self.ttl}
+
+    def get_or_compute(self, key, compute):
+        """
+        Return (value, freshness) for key, calling compute() when needed.
+        compute() must raise on failure; the exception propagates only when
+        there is no entry young enough to serve in its place.
+        """
+        entry = self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            age = now - entry.stored_at
+            if age <= self.ttl:
+                return entry.value, self._freshness("fresh", entry)
+            if age <= self.ttl + self.max_stale:
+                self._refresh_in_background(key, compute, entry)
+                return entry.value, self._freshness("stale", entry)
+
+        try:
+            value = compute()
+        except Exception as e:
+            if entry is not None and now - entry.stored_at <= self.ttl + self.stale_if_error:
+                log_event(logging.WARNING, "Serving stale answer after generation error", error=str(e))
+                return entry.value, self._freshness("stale-if-error", entry)
+            raise
+        self.put(key, value)
+        return value, self._freshness("miss")
+
+    def _refresh_in_background(self, key, compute, entry: _Entry):
+        with self._lock:
+            if key in self._refreshing or time.time() < entry.retry_at:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(key, compute())
+            except Exception as e:
+                # Keep serving the stale answer; try again after a pause
+                log_event(logging.WARNING, "Background answer refresh failed", error=str(e))
+                entry.retry_at = time.time() + REFRESH_BACKOFF
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
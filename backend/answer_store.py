@@ -0,0 +1,97 @@
+"""
+Persistent store of precomputed answers.
+
+precompute_answers.py fills a local SQLite file with answers to canonical
+questions about every chatbot_knowledge entry; app.py loads it into the answer
+cache at startup so the first users after a deploy do not wait for Gemini.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+ANSWER_STORE_PATH = os.getenv(
+    "ANSWER_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_store.db"),
+)
+
+SCHEMA_VERSION = 2
+
+
+def entry_hash(entry: dict) -> str:
+    """Hash of the fields an answer depends on."""
+    digest = hashlib.sha256()
+    for field in ("category", "title", "description"):
+        digest.update(str(entry.get(field) or "").encode("utf-8") + b"\x00")
+    digest.update("\x00".join(entry.get("keywords") or []).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerStore:
+    """SQLite-backed answers grouped by knowledge base entry."""
+
+    def __init__(self, path: str = ANSWER_STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # Version 1 keyed answers by question alone, so entries asking the same
+            # question overwrote each other; start over and regenerate everything
+            self.conn.executescript(
+                """
+                DROP TABLE IF EXISTS answers;
+                DROP TABLE IF EXISTS entries;
+                """
+            )
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                title TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS answers (
+                title TEXT NOT NULL,
+                question TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                reply TEXT NOT NULL,
+                source TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (title, question)
+            );
+            """
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def entry_hashes(self) -> dict:
+        return dict(self.conn.execute("SELECT title, content_hash FROM entries"))
+
+    def replace_entry(self, title: str, content_hash: str, answers: list):
+        """Atomically replace all answers of one entry. answers: (question, reply, source)."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute("DELETE FROM answers WHERE title = ?", (title,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO answers (title, question, content_hash, reply, source, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(title, question, content_hash, reply, source, now) for question, reply, source in answers],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (title, content_hash, updated_at) VALUES (?, ?, ?)",
+                (title, content_hash, now),
+            )
+
+    def remove_entries(self, titles: list):
+        with self.conn:
+            for title in titles:
+                self.conn.execute("DELETE FROM answers WHERE title = ?", (title,))
+                self.conn.execute("DELETE FROM entries WHERE title = ?", (title,))
+
+    def load_answers(self) -> list:
+        """All stored answers as dicts, oldest first."""
+        cursor = self.conn.execute(
+            "SELECT question, title, content_hash, reply, source, created_at FROM answers ORDER BY created_at")
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
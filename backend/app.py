@@ -1,6 +1,12 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory  # type: ignore
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context  # type: ignore
+import json
+import logging
 import os
-from difflib import SequenceMatcher
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
 # Handle potential import issues gracefully
 try:
@@ -20,7 +26,16 @@ load_dotenv()
 # Import requests
 import requests  # type: ignore
     
-from supabase_client import supabase, get_knowledge_entry, get_all_categories, get_category_entries, log_chat_interaction
+from supabase_client import supabase, get_knowledge_entry, get_all_categories, get_category_entries, log_chat_interaction, log_chat_interactions, get_category_popularity
+from knowledge_index import PassageIndex, format_context, fuzzy_match_batch
+from admission import admission_controlled, rate_limited, batch_rate_limiter, suggest_rate_limiter
+from query_normalizer import QueryNormalizer
+from answer_cache import AnswerCache
+from answer_store import ANSWER_STORE_PATH, AnswerStore, entry_hash
+from profiler import profiler, profiled
+from tracing import traced, span, log_event
+from admin_auth import admin_required
+from suggest import SuggestionIndex
 
 app = Flask(__name__)
 
@@ -42,9 +57,23 @@ if CORS:
     CORS(app, 
          origins=cors_origins,
          methods=["GET", "POST", "OPTIONS"],
-         allow_headers=["Content-Type", "Authorization"],
+         allow_headers=["Content-Type", "Authorization", "X-Client-Id"],
+         expose_headers=["Retry-After", "X-Request-Id"],
          supports_credentials=True)
 
+# ----------------------------
+# Synonyms
+# ----------------------------
+synonyms = {
+    "cybersecurity service": "cybersecurity services",
+    "infrastructure service": "infrastructure services",
+    "data analytic": "data analytics",
+    "oracle financial": "oracle financials",
+    "rpa service": "rpa services",
+    "mobile app development": "mobile development",
+    "web app development": "web development"
+}
+
 # ----------------------------
 # Knowledge base (with YVI data in paragraph format)
 # ----------------------------
@@ -53,8 +82,34 @@ if CORS:
 # Initialize knowledge base from Supabase
 knowledge_base = {}
 
+# Raw chatbot_knowledge rows the indexes were built from
+knowledge_entries = []
+
+# Passage-level index used to select the context sent to Gemini
+passage_index = PassageIndex()
+
+# Normalization and spelling correction, rebuilt when the index version changes
+query_normalizer = QueryNormalizer()
+
+# Generated answers, served stale while revalidating and when Gemini fails
+answer_cache = AnswerCache()
+
+# Typeahead over KB titles and keywords, ranked by how often categories are matched
+suggestion_index = SuggestionIndex()
+
+# Seconds before the suggestion popularity counts are reloaded from chatbot_logs
+SUGGEST_REFRESH_SECONDS = float(os.getenv("SUGGEST_REFRESH_SECONDS", 900))
+
+# Longest q accepted by /api/suggest
+SUGGEST_MAX_QUERY_CHARS = 64
+
+_suggest_refresh_lock = threading.Lock()
+
+# Whether chat responses say how fresh the answer is ("fresh", "stale", ...)
+ANSWER_FRESHNESS_METADATA = os.getenv("ANSWER_FRESHNESS_METADATA", "true").lower() in ("1", "true", "yes")
+
 def load_knowledge_base():
-    global knowledge_base
+    global knowledge_base, knowledge_entries, query_normalizer
     # Check if Supabase is configured
     if supabase is None:
         print("Supabase not configured, loading static knowledge base")
@@ -71,7 +126,12 @@ def load_knowledge_base():
                     "title": item["title"],
                     "answer": item["description"]
                 }
-            print(f"Loaded {len(knowledge_base)} entries from Supabase")
+            knowledge_entries = response.data
+            passage_index.build(response.data)
+            if query_normalizer.version != passage_index.version:
+                query_normalizer = QueryNormalizer(response.data, synonyms, passage_index.version)
+            refresh_suggestions()
+            print(f"Loaded {len(knowledge_base)} entries from Supabase ({len(passage_index)} passages)")
         else:
             print("No data received from Supabase")
             load_static_knowledge_base()
@@ -89,56 +149,244 @@ def load_static_knowledge_base():
     knowledge_base = static_knowledge_base.copy()
     print("Loaded static knowledge base as fallback - but this should not be used with Supabase configured")
 
+def refresh_suggestions():
+    """Rebuild the suggestion index from the loaded entries and current popularity."""
+    global suggestion_index
+    suggestion_index = SuggestionIndex(knowledge_entries, get_category_popularity())
+
+def _refresh_suggestions_in_background():
+    # Single flight: requests keep using the current index while it is rebuilt
+    if not _suggest_refresh_lock.acquire(blocking=False):
+        return
+
+    def refresh():
+        try:
+            refresh_suggestions()
+        except Exception as e:
+            log_event(logging.WARNING, "Suggestion index refresh failed", error=str(e))
+            # Keep the old index, try again after another refresh interval
+            suggestion_index.built_at = time.time()
+        finally:
+            _suggest_refresh_lock.release()
+
+    threading.Thread(target=refresh, name="suggest-refresh", daemon=True).start()
+
+# Seconds between checks for a new precompute_answers.py run
+ANSWER_STORE_CHECK_SECONDS = float(os.getenv("ANSWER_STORE_CHECK_SECONDS", 60))
+
+_answer_store_mtime = None
+_answer_store_checked_at = 0.0
+_answer_store_lock = threading.Lock()
+
+def warm_answer_cache():
+    """Load precomputed answers for unchanged KB entries into the answer cache."""
+    global _answer_store_mtime
+    if not os.path.exists(ANSWER_STORE_PATH):
+        return
+    mtime = os.path.getmtime(ANSWER_STORE_PATH)
+    current_hashes = {entry["title"]: entry_hash(entry) for entry in knowledge_entries}
+    store = AnswerStore(ANSWER_STORE_PATH)
+    try:
+        loaded = 0
+        now = time.time()
+        # Oldest first, so the newest answer to a question several entries ask wins
+        for answer in store.load_answers():
+            if current_hashes.get(answer["title"]) != answer["content_hash"]:
+                continue
+            key = answer_cache.key(answer["question"], passage_index.version)
+            # The content hash still matches, so the answer is as good as a new one;
+            # its creation time would push answers of unchanged entries past max-stale
+            answer_cache.put(key, (answer["reply"], answer["source"]), stored_at=now)
+            loaded += 1
+        _answer_store_mtime = mtime
+        log_event(logging.INFO, "Warmed answer cache with precomputed answers", answers=loaded)
+    except Exception as e:
+        log_event(logging.ERROR, "Error loading precomputed answers", error=str(e))
+    finally:
+        store.close()
+
+def reload_answer_store_if_changed():
+    """Warm the cache again, in the background, after a new precompute run."""
+    global _answer_store_checked_at
+    now = time.time()
+    if now - _answer_store_checked_at < ANSWER_STORE_CHECK_SECONDS:
+        return
+    _answer_store_checked_at = now
+    try:
+        changed = os.path.getmtime(ANSWER_STORE_PATH) != _answer_store_mtime
+    except OSError:
+        return
+    if not changed or not _answer_store_lock.acquire(blocking=False):
+        return
+
+    def reload():
+        try:
+            warm_answer_cache()
+        finally:
+            _answer_store_lock.release()
+
+    threading.Thread(target=reload, name="answer-store-reload", daemon=True).start()
+
 # Load knowledge base on startup
 load_knowledge_base()
-
-# ----------------------------
-# Synonyms
-# ----------------------------
-synonyms = {
-    "cybersecurity service": "cybersecurity services",
-    "infrastructure service": "infrastructure services",
-    "data analytic": "data analytics",
-    "oracle financial": "oracle financials",
-    "rpa service": "rpa services",
-    "mobile app development": "mobile development",
-    "web app development": "web development"
-}
+warm_answer_cache()
 
 # ----------------------------
 # Chat endpoint
 # ----------------------------
 @app.route("/chat", methods=["POST"])
+@traced
+@admission_controlled()
+@profiled
 def chat():
     data = request.get_json()
     user_query = data.get("message", "").strip()
 
-    # 1️⃣ Search database
-    search_result = search_database(user_query)
+    # 1️⃣ Normalize the query and search database
+    with span("normalize"):
+        search_query = query_normalizer.normalize(user_query)
+    with span("search") as attrs:
+        search_result = search_database(search_query)
+        attrs["hit"] = search_result is not None
 
-    if search_result:
-        db_data = search_result["match"]
-        context_text = db_data.get("description", "")
-        confidence = search_result["confidence"]
+    # 2️⃣ Enrich with Gemini or fall back to it
+    reload_answer_store_if_changed()
+    reply, source, freshness = generate_reply(user_query, search_result, search_query)
 
-        # 2️⃣ Enrich with Gemini
-        enriched_reply = call_gemini_api(user_query, context_text)
-        reply = enriched_reply
-        source = "Enriched Hybrid"
-    else:
-        # 3️⃣ Fallback to Gemini
-        reply = call_gemini_api(user_query)
-        source = "AI Response"
-
-    # 4️⃣ Log the chat
+    # 3️⃣ Log the chat
     matched_category = None
     if search_result:
         matched_category = search_result.get("match", {}).get("category")
-    log_chat_interaction(user_query, reply, matched_category, source)
+    with span("log"):
+        log_chat_interaction(user_query, reply, matched_category, source)
 
-    return jsonify({
-        "reply": reply
-    })
+    response = {"reply": reply}
+    if ANSWER_FRESHNESS_METADATA:
+        response["freshness"] = freshness
+    return jsonify(response)
+
+# ----------------------------
+# Typeahead suggestions
+# ----------------------------
+@app.route("/api/suggest", methods=["GET"])
+@rate_limited(suggest_rate_limiter)
+def suggest():
+    query = request.args.get("q", "")[:SUGGEST_MAX_QUERY_CHARS]
+    if time.time() - suggestion_index.built_at > SUGGEST_REFRESH_SECONDS:
+        _refresh_suggestions_in_background()
+    response = jsonify({"query": query, "suggestions": suggestion_index.lookup(query)})
+    # Same prefix, same answer: let the browser reuse it while the user edits
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
+
+def build_answer(user_query: str, search_result, search_query: str = None):
+    """Ask Gemini for an answer and return (reply, source). Raises on failure."""
+    if search_result:
+        db_data = search_result["match"]
+        # Only send the passages relevant to the question, not the whole entry
+        with span("retrieve_passages") as attrs:
+            passages = passage_index.search(search_query or user_query)
+            attrs["passages"] = len(passages)
+        context_text = format_context(passages) if passages else db_data.get("description", "")
+        return request_gemini(user_query, context_text), "Enriched Hybrid"
+    return request_gemini(user_query), "AI Response"
+
+def generate_reply(user_query: str, search_result, search_query: str = None):
+    """
+    Answer a query with Gemini, through the answer cache.
+    Returns (reply, source, freshness).
+    """
+    key = answer_cache.key(user_query, passage_index.version)
+    try:
+        (reply, source), freshness = answer_cache.get_or_compute(
+            key, lambda: build_answer(user_query, search_result, search_query))
+    except Exception as e:
+        source = "Enriched Hybrid" if search_result else "AI Response"
+        return gemini_fallback_reply(e), source, {"status": "error", "age": 0.0, "ttl": answer_cache.ttl}
+    return reply, source, freshness
+
+# ----------------------------
+# Batch chat endpoint
+# ----------------------------
+BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", 200))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+
+# Shared pool so that concurrent batches cannot multiply the load on Gemini
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix="chat-batch")
+
+def _batch_cost():
+    # Duplicates are answered once, so only unique messages are charged
+    data = request.get_json(silent=True)
+    messages = data.get("messages") if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return 1.0
+    return float(max(1, len({m.strip() for m in messages})))
+
+@app.route("/chat/batch", methods=["POST"])
+@traced
+@admission_controlled(cost=_batch_cost, limiter=batch_rate_limiter, scope="batch")
+def chat_batch():
+    """
+    Answer a list of messages in one request.
+    Duplicate messages are answered once, retrieval runs for all of them in one
+    pass and Gemini calls are fanned out over a bounded pool. Results are
+    streamed back as newline-delimited JSON, in input order, as they finish.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    messages = data.get("messages")
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return jsonify({"error": "'messages' must be a list of strings"}), 400
+    if len(messages) > BATCH_MAX_MESSAGES:
+        return jsonify({"error": f"At most {BATCH_MAX_MESSAGES} messages per batch"}), 400
+
+    reload_answer_store_if_changed()
+    queries = [m.strip() for m in messages]
+    unique_queries = list(dict.fromkeys(queries))
+    with span("normalize", messages=len(queries), unique=len(unique_queries)):
+        search_queries = {query: query_normalizer.normalize(query) for query in unique_queries}
+    with span("search"):
+        search_results = dict(zip(unique_queries, search_database_batch([search_queries[q] for q in unique_queries])))
+
+    def answer(query):
+        try:
+            with span("answer"):
+                return generate_reply(query, search_results[query], search_queries[query])
+        except Exception as e:
+            log_event(logging.ERROR, "Batch chat error", error=str(e))
+            return GEMINI_ERROR_REPLY, "Error", {"status": "error", "age": 0.0, "ttl": answer_cache.ttl}
+
+    # Run each answer in a copy of the request context so its spans join this trace
+    futures = {query: batch_executor.submit(copy_context().run, answer, query) for query in unique_queries}
+
+    def generate():
+        log_rows = []
+        try:
+            for index, query in enumerate(queries):
+                reply, source, freshness = futures[query].result()
+                search_result = search_results[query]
+                matched_category = search_result["match"].get("category") if search_result else None
+                log_rows.append({
+                    "user_query": query,
+                    "bot_response": reply,
+                    "matched_category": matched_category,
+                    "source": source
+                })
+                line = {"index": index, "message": query, "reply": reply}
+                if ANSWER_FRESHNESS_METADATA:
+                    line["freshness"] = freshness
+                yield json.dumps(line) + "\n"
+        finally:
+            # The client may have gone away mid-stream: stop answering for it,
+            # but still log what it was sent
+            for future in futures.values():
+                future.cancel()
+            if log_rows:
+                with span("log", rows=len(log_rows)):
+                    log_chat_interactions(log_rows)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 # ----------------------------
 # Chat Session Management Endpoints
@@ -158,49 +406,49 @@ def delete_chat_session(session_id):
 # ----------------------------
 def search_database(query: str):
     """Improved semantic fuzzy search on Supabase data."""
+    return search_database_batch([query])[0]
+
+def search_database_batch(queries: list) -> list:
+    """
+    Fuzzy search for several queries at once.
+    The knowledge table is fetched once and each row's text is prepared once
+    for all queries instead of once per query.
+    """
     if supabase is None:
-        return None
+        return [None] * len(queries)
         
     try:
         result = supabase.table("chatbot_knowledge").select("*").execute()
         if not result or not hasattr(result, 'data'):
-            print("Invalid response from Supabase")
-            return None
+            log_event(logging.WARNING, "Invalid response from Supabase")
+            return [None] * len(queries)
             
-        best_match = None
-        best_score = 0
-
-        for item in result.data:
-            combined = f"{item.get('title','')} {item.get('description','')}".lower()
-            score = SequenceMatcher(None, query.lower(), combined).ratio()
-            if score > best_score:
-                best_score = score
-                best_match = item
-
-        if best_score > 0.1:
-            return {"match": best_match, "confidence": round(best_score * 100, 1)}
-        return None
+        return fuzzy_match_batch(queries, result.data)
     except Exception as e:
-        print("Database search error:", e)
-        return None
-
-def call_gemini_api(prompt: str, context: str = "") -> str:
-    """Call Gemini API with optional contextual enrichment."""
+        log_event(logging.ERROR, "Database search error", error=str(e))
+        return [None] * len(queries)
+
+def request_gemini(prompt: str, context: str = "") -> str:
+    """
+    Call Gemini API with optional contextual enrichment.
+    Raises on timeouts and errors; see call_gemini_api for the safe variant.
+    """
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     if not GEMINI_API_KEY:
         raise Exception("GEMINI_API_KEY not configured")
         
-    system_prompt = (
-        "You are YVI Technologies Assistant — an intelligent AI system for YVI Technologies, "
-        "a global software and AI innovation company based in Hyderabad, India. "
-        "Always introduce yourself as the YVI Technologies Assistant. "
-        "If users mention YVI Soft Solutions, clarify that the company is now called YVI Technologies."
-    )
-
-    combined_prompt = f"{system_prompt}\n\n"
-    if context:
-        combined_prompt += f"Here is some relevant company data:\n{context}\n\n"
-    combined_prompt += f"""
+    with span("prompt_build") as attrs:
+        system_prompt = (
+            "You are YVI Technologies Assistant — an intelligent AI system for YVI Technologies, "
+            "a global software and AI innovation company based in Hyderabad, India. "
+            "Always introduce yourself as the YVI Technologies Assistant. "
+            "If users mention YVI Soft Solutions, clarify that the company is now called YVI Technologies."
+        )
+
+        combined_prompt = f"{system_prompt}\n\n"
+        if context:
+            combined_prompt += f"Here is some relevant company data:\n{context}\n\n"
+        combined_prompt += f"""
 Always refer to the company as YVI Technologies.
 If any previous version or old name appears (like YVI Soft Solutions),
 clarify that it has been rebranded to YVI Technologies.
@@ -208,22 +456,25 @@ clarify that it has been rebranded to YVI Technologies.
 User: {prompt}
 Assistant:
 """
+        attrs["prompt_chars"] = len(combined_prompt)
+        attrs["context_chars"] = len(context)
 
-    try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-        headers = {"Content-Type": "application/json"}
-        payload = {"contents": [{"parts": [{"text": combined_prompt}]}]}
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
+    headers = {"Content-Type": "application/json"}
+    payload = {"contents": [{"parts": [{"text": combined_prompt}]}]}
 
+    with span("gemini") as attrs:
         # Set timeout to 30 seconds to match frontend
         r = requests.post(url, headers=headers, json=payload, timeout=30)
+        attrs["status"] = r.status_code
         result = r.json()
-        
-        # Check if response has the expected structure
-        if "candidates" in result and len(result["candidates"]) > 0 and "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
+    
+    # Check if response has the expected structure
+    if "candidates" in result and len(result["candidates"]) > 0 and "content" in result["candidates"][0] and "parts" in result["candidates"][0]["content"]:
+        with span("post_process"):
             response = result["candidates"][0]["content"]["parts"][0]["text"]
             # Comprehensive post-processing to ensure correct company name
             # Handle various case variations
-            import re
             response = re.sub(r'[Yy][Vv][Ii]\s*[Ss][Oo][Ff][Tt]\s*[Ss][Oo][Ll][Uu][Tt][Ii][Oo][Nn][Ss]', 'YVI Technologies', response)
             response = re.sub(r'[Yy][Vv][Ii]\s*[Ss][Oo][Ff][Tt]', 'YVI Technologies', response)
             # Handle extra spaces and variations
@@ -235,19 +486,28 @@ Assistant:
             response = response.replace("YVI  Soft", "YVI Technologies")  # Handle extra spaces
             response = response.replace("YVI Soft Solution", "YVI Technologies")  # Handle singular form
             response = response.replace("YVI Soft Solution's", "YVI Technologies'")  # Handle possessive form
-            return response
-        else:
-            raise Exception("Unexpected API response structure")
+        return response
+    else:
+        raise Exception("Unexpected API response structure")
 
-    except requests.exceptions.Timeout:
-        print("Gemini API timeout error")
-        fallback_response = "The request is taking longer than expected. Please try a shorter question or try again later."
-        return fallback_response
+GEMINI_TIMEOUT_REPLY = "The request is taking longer than expected. Please try a shorter question or try again later."
+# Even in error cases, ensure we don't leak the wrong company name
+GEMINI_ERROR_REPLY = "I'm having trouble connecting to the AI service right now. Please try again shortly."
+
+def gemini_fallback_reply(error: Exception) -> str:
+    """Log a failed Gemini call and return the message shown to the user."""
+    if isinstance(error, requests.exceptions.Timeout):
+        log_event(logging.WARNING, "Gemini API timeout error")
+        return GEMINI_TIMEOUT_REPLY
+    log_event(logging.ERROR, "Gemini API error", error=str(error))
+    return GEMINI_ERROR_REPLY
+
+def call_gemini_api(prompt: str, context: str = "") -> str:
+    """Call Gemini API with optional contextual enrichment."""
+    try:
+        return request_gemini(prompt, context)
     except Exception as e:
-        print("Gemini API error:", e)
-        # Even in error cases, ensure we don't leak the wrong company name
-        fallback_response = "I'm having trouble connecting to the AI service right now. Please try again shortly."
-        return fallback_response
+        return gemini_fallback_reply(e)
 
 # ----------------------------
 # Admin Dashboard Routes
@@ -315,6 +575,47 @@ def api_logs():
         }
     ])
 
+# ----------------------------
+# Profiler (admin only)
+# ----------------------------
+@app.route("/api/admin/profiler", methods=["GET", "POST"])
+@admin_required
+def profiler_settings():
+    """Show or change profiler settings: enabled, sample_rate, slow_threshold, reset."""
+    if request.method == "POST":
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+        if not isinstance(data.get("reset", False), bool):
+            return jsonify({"error": "Invalid profiler setting: reset must be true or false"}), 400
+        try:
+            profiler.configure(
+                enabled=data.get("enabled"),
+                sample_rate=data.get("sample_rate"),
+                slow_threshold=data.get("slow_threshold"),
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid profiler setting: {e}"}), 400
+        if data.get("reset", False):
+            profiler.reset()
+    return jsonify(profiler.status())
+
+@app.route("/api/admin/profiler/flamegraph")
+@admin_required
+def profiler_flamegraph():
+    """Download sampled stacks in collapsed format (flamegraph.pl, speedscope)."""
+    return Response(
+        profiler.collapsed(),
+        mimetype="text/plain",
+        headers={"Content-Disposition": "attachment; filename=chat-profile.collapsed"},
+    )
+
+@app.route("/api/admin/profiler/slow")
+@admin_required
+def profiler_slow_requests():
+    """Recent slow requests with stage timings and captured stacks."""
+    return jsonify(list(profiler.slow_requests))
+
 # ----------------------------
 # Serve React Frontend
 # ----------------------------
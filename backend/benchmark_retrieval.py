@@ -0,0 +1,259 @@
+"""
+Script to benchmark knowledge base retrieval on synthetic chatbot_knowledge data
+
+Generates corpora of increasing size with labelled queries (exact titles,
+paraphrases and typos) and measures, for every retrieval strategy the app
+offers, index build time, memory, per-query latency and top-k accuracy.
+
+Usage:
+    python benchmark_retrieval.py --sizes 100 1000 10000 100000 1000000
+"""
+import argparse
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+
+from knowledge_index import PassageIndex, fuzzy_scores, tokenize
+from query_normalizer import QueryNormalizer
+
+DOMAINS = [
+    "oracle", "cloud", "data", "security", "mobile", "web", "analytics", "payroll",
+    "procurement", "logistics", "marketing", "finance", "hr", "crm", "erp",
+    "infrastructure", "devops", "automation", "ai", "testing",
+]
+NOUNS = [
+    "platform", "services", "consulting", "migration", "integration", "management",
+    "support", "modernization", "implementation", "optimization", "assessment", "strategy",
+]
+SYLLABLES = [
+    "ve", "lo", "ra", "ni", "ko", "ta", "mi", "su", "da", "re",
+    "no", "pa", "zi", "lu", "ge", "ho", "fa", "ri", "to", "ma",
+]
+FEATURES = [
+    "Real-Time Dashboards", "Automated Reporting", "Role-Based Access", "Workflow Automation",
+    "Audit Trails", "Predictive Analytics", "Mobile Access", "Single Sign-On",
+    "Data Migration", "Custom Integrations", "Compliance Controls", "Usage Analytics",
+]
+BENEFITS = [
+    "Reduce Operational Costs", "Improve Accuracy", "Increase Productivity",
+    "Scale Easily", "Enhance Risk Management", "Faster Decision-Making",
+]
+PARAPHRASES = [
+    "tell me about your {code} {noun}",
+    "what {noun} do you offer for {domain} {code}",
+    "do you provide {domain} {noun_singular} like {code}?",
+    "I need help with {code} {domain}",
+    "{domain} {code} details please",
+]
+
+
+def _code_word(n: int) -> str:
+    """Deterministic pseudo-word for index n ("velora", ...)."""
+    parts = []
+    for _ in range(3):
+        n, r = divmod(n, len(SYLLABLES))
+        parts.append(SYLLABLES[r])
+    return "".join(parts)
+
+
+def generate_corpus(size: int, seed: int = 42) -> list:
+    """Synthetic chatbot_knowledge rows shaped like the real ones."""
+    rng = random.Random(seed)
+    combos = len(DOMAINS) * len(NOUNS)
+    rows = []
+    for i in range(size):
+        domain = DOMAINS[i % len(DOMAINS)]
+        noun = NOUNS[(i // len(DOMAINS)) % len(NOUNS)]
+        code = _code_word(i // combos)
+        features = rng.sample(FEATURES, 4)
+        benefits = rng.sample(BENEFITS, 3)
+        description = (
+            f"{code.title()} {domain.title()} {noun.title()}:\n\n"
+            f"We deliver {domain} {noun} through our {code.title()} practice, helping enterprises "
+            f"plan, deliver and run {domain} solutions with confidence.\n\n"
+            "Features:\n" + "\n".join(f"- {f}" for f in features) + "\n\n"
+            "Benefits:\n" + "\n".join(f"- {b}" for b in benefits)
+        )
+        rows.append({
+            "category": domain.title(),
+            "title": f"{code.title()} {domain.title()} {noun.title()}",
+            "keywords": [domain, noun, code],
+            "description": description,
+            "_parts": (domain, noun, code),
+        })
+    return rows
+
+
+def _typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(["swap", "delete", "insert", "replace"])
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    if kind == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == "delete":
+        return word[:i] + word[i + 1:]
+    if kind == "insert":
+        return word[:i] + letter + word[i:]
+    return word[:i] + letter + word[i + 1:]
+
+
+def generate_queries(rows: list, count: int, seed: int = 7) -> list:
+    """Labelled (query, kind, row index) triples: exact, paraphrase and typo."""
+    rng = random.Random(seed)
+    queries = []
+    for n in range(count):
+        target = rng.randrange(len(rows))
+        domain, noun, code = rows[target]["_parts"]
+        kind = ("exact", "paraphrase", "typo")[n % 3]
+        if kind == "exact":
+            text = rows[target]["title"]
+        elif kind == "paraphrase":
+            text = rng.choice(PARAPHRASES).format(
+                code=code, domain=domain, noun=noun, noun_singular=noun.rstrip("s"))
+        else:
+            words = [code, domain, noun]
+            longest = max(range(3), key=lambda k: len(words[k]))
+            words[longest] = _typo(words[longest], rng)
+            text = " ".join(words)
+        queries.append((text, kind, target))
+    return queries
+
+
+class SequenceMatcherStrategy:
+    """
+    The search_database scan: SequenceMatcher over every row. Behind the
+    query normalizer this is what /chat runs.
+    """
+
+    def __init__(self, normalize: bool):
+        self.normalize = normalize
+        self.name = "sequence_matcher+normalizer" if normalize else "sequence_matcher"
+
+    def build(self, rows):
+        self.rows = rows
+        self.normalizer = QueryNormalizer(rows, {}, PassageIndex(rows).version) if self.normalize else None
+
+    def rank(self, query: str, k: int) -> list:
+        if self.normalizer is not None:
+            query = self.normalizer.normalize(query)
+        scores = fuzzy_scores([query], self.rows)[0]
+        return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+
+
+class PassageStrategy:
+    """BM25 over KB passages, optionally behind the query normalizer."""
+
+    def __init__(self, normalize: bool):
+        self.normalize = normalize
+        self.name = "bm25_passages+normalizer" if normalize else "bm25_passages"
+
+    def build(self, rows):
+        self.index = PassageIndex(rows)
+        self.row_of = {row["title"]: i for i, row in enumerate(rows)}
+        self.normalizer = QueryNormalizer(rows, {}, self.index.version) if self.normalize else None
+
+    def rank(self, query: str, k: int) -> list:
+        if self.normalizer is not None:
+            query = self.normalizer.normalize(query)
+        scores = self.index.score(tokenize(query))
+        best = {}
+        for i, score in enumerate(scores):
+            if score > 0:
+                row = self.row_of[self.index.passages[i]["title"]]
+                if score > best.get(row, 0):
+                    best[row] = score
+        return sorted(best, key=best.get, reverse=True)[:k]
+
+
+def run_strategy(strategy, rows, queries, k, budget, measure_memory):
+    gc.collect()
+    started = time.perf_counter()
+    strategy.build(rows)
+    build_seconds = time.perf_counter() - started
+
+    memory_mb = None
+    if measure_memory:
+        gc.collect()
+        tracemalloc.start()
+        strategy.build(rows)
+        memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    latencies = []
+    hits_top1 = {}
+    hits_topk = {}
+    totals = {}
+    deadline = time.perf_counter() + budget
+    for text, kind, target in queries:
+        if time.perf_counter() > deadline:
+            break
+        t0 = time.perf_counter()
+        ranked = strategy.rank(text, k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        totals[kind] = totals.get(kind, 0) + 1
+        hits_top1[kind] = hits_top1.get(kind, 0) + (1 if ranked[:1] == [target] else 0)
+        hits_topk[kind] = hits_topk.get(kind, 0) + (1 if target in ranked else 0)
+
+    measured = len(latencies)
+    return {
+        "strategy": strategy.name,
+        "rows": len(rows),
+        "build_s": build_seconds,
+        "memory_mb": memory_mb,
+        "queries": measured,
+        "p50_ms": statistics.median(latencies) if latencies else None,
+        "p95_ms": sorted(latencies)[int(0.95 * (measured - 1))] if latencies else None,
+        "top1": sum(hits_top1.values()) / measured if measured else None,
+        "topk": sum(hits_topk.values()) / measured if measured else None,
+        "top1_by_kind": {kind: hits_top1[kind] / totals[kind] for kind in totals},
+    }
+
+
+def _fmt(value, pattern):
+    return "-" if value is None else pattern.format(value)
+
+
+def print_table(results: list, k: int):
+    print(f"| strategy | rows | build s | memory MB | queries | p50 ms | p95 ms | top-1 | top-{k} | top-1 exact / paraphrase / typo |")
+    print("|---|---:|---:|---:|---:|---:|---:|---:|---:|---|")
+    for r in results:
+        by_kind = " / ".join(_fmt(r["top1_by_kind"].get(kind), "{:.0%}") for kind in ("exact", "paraphrase", "typo"))
+        print(
+            f"| {r['strategy']} | {r['rows']:,} | {_fmt(r['build_s'], '{:.2f}')} | {_fmt(r['memory_mb'], '{:.1f}')} "
+            f"| {r['queries']} | {_fmt(r['p50_ms'], '{:.2f}')} | {_fmt(r['p95_ms'], '{:.2f}')} "
+            f"| {_fmt(r['top1'], '{:.0%}')} | {_fmt(r['topk'], '{:.0%}')} | {by_kind} |"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--queries", type=int, default=150, help="labelled queries per corpus")
+    parser.add_argument("--k", type=int, default=5, help="k for top-k accuracy")
+    parser.add_argument("--budget", type=float, default=60, help="max seconds of queries per strategy and size")
+    parser.add_argument("--memory-max-rows", type=int, default=100000,
+                        help="measure memory (a second, traced build) up to this corpus size")
+    parser.add_argument("--baseline-max-rows", type=int, default=100000,
+                        help="skip the SequenceMatcher scan above this corpus size")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        rows = generate_corpus(size)
+        queries = generate_queries(rows, args.queries)
+        strategies = [PassageStrategy(normalize=False), PassageStrategy(normalize=True)]
+        if size <= args.baseline_max_rows:
+            strategies[:0] = [SequenceMatcherStrategy(normalize=False), SequenceMatcherStrategy(normalize=True)]
+        for strategy in strategies:
+            print(f"Running {strategy.name} on {size:,} rows...", flush=True)
+            results.append(run_strategy(
+                strategy, rows, queries, args.k, args.budget, size <= args.memory_max_rows))
+        print()
+
+    print_table(results, args.k)
+
+
+if __name__ == "__main__":
+    main()
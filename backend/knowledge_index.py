@@ -0,0 +1,275 @@
+"""
+Passage-level index over the chatbot_knowledge table.
+
+Long descriptions (Oracle HCM, Oracle SCM, Data & AI Solutions, ...) are split
+into passages at index time so that only the parts relevant to a question are
+sent to Gemini instead of the whole entry.
+"""
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+# Maximum size of a single passage before a bullet list is split further
+MAX_PASSAGE_CHARS = int(os.getenv("KB_MAX_PASSAGE_CHARS", 600))
+
+# Size budget for the context pasted into the Gemini prompt
+CONTEXT_MAX_CHARS = int(os.getenv("KB_CONTEXT_MAX_CHARS", 1500))
+CONTEXT_MAX_PASSAGES = int(os.getenv("KB_CONTEXT_MAX_PASSAGES", 4))
+
+# Minimum SequenceMatcher ratio for the fuzzy scan to report a match
+FUZZY_MATCH_THRESHOLD = 0.1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Extra weight for query terms found in an entry's title or keywords
+TITLE_BOOST = 1.5
+
+# Passages scoring below this fraction of the best passage are not sent
+MIN_RELATIVE_SCORE = 0.35
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "of", "on", "or", "our", "the",
+    "to", "we", "what", "which", "with", "you", "your", "about", "tell",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_BULLET_RE = re.compile(r"^\s*[-*•]\s+")
+
+
+def stem(word: str) -> str:
+    """Very light stemmer that only folds plurals ("services" -> "service")."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, stemmed word tokens with stopwords removed."""
+    return [stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _split_block(block: str) -> list:
+    """
+    Split one paragraph block into passages no longer than MAX_PASSAGE_CHARS.
+    Bullet lists are split between bullets and the heading line ("Features:")
+    is repeated on every piece so each passage stands on its own.
+    """
+    if len(block) <= MAX_PASSAGE_CHARS:
+        return [block]
+
+    lines = block.split("\n")
+    heading = ""
+    if lines and not _BULLET_RE.match(lines[0]):
+        heading = lines[0]
+        lines = lines[1:]
+
+    passages = []
+    current = []
+    current_len = len(heading)
+    for line in lines:
+        if current and current_len + len(line) + 1 > MAX_PASSAGE_CHARS:
+            passages.append("\n".join(([heading] if heading else []) + current))
+            current = []
+            current_len = len(heading)
+        current.append(line)
+        current_len += len(line) + 1
+    if current:
+        passages.append("\n".join(([heading] if heading else []) + current))
+    return passages
+
+
+def split_into_passages(entry: dict) -> list:
+    """
+    Split a chatbot_knowledge row into passages using the blank-line and
+    bullet structure the descriptions already use.
+    """
+    description = (entry.get("description") or "").strip()
+    blocks = [b.strip() for b in re.split(r"\n\s*\n", description) if b.strip()]
+
+    # A lone heading line ("Oracle Financials:") belongs with the block after it
+    merged = []
+    pending = ""
+    for block in blocks:
+        if "\n" not in block and block.endswith(":"):
+            pending = f"{pending}\n{block}" if pending else block
+            continue
+        merged.append(f"{pending}\n{block}" if pending else block)
+        pending = ""
+    if pending:
+        merged.append(pending)
+    blocks = merged
+
+    passages = []
+    for block in blocks:
+        for text in _split_block(block):
+            passages.append({
+                "title": entry.get("title", ""),
+                "category": entry.get("category"),
+                "keywords": entry.get("keywords") or [],
+                "text": text,
+                "position": len(passages),
+            })
+    return passages
+
+
+class PassageIndex:
+    """BM25 index over knowledge base passages."""
+
+    def __init__(self, entries=None):
+        self.passages = []
+        self.version = None
+        self._term_freqs = []
+        self._boost_terms = []
+        self._doc_freq = Counter()
+        self._lengths = []
+        self._avg_length = 0.0
+        self.build(entries or [])
+
+    def build(self, entries: list):
+        """(Re)build the index from a list of chatbot_knowledge rows."""
+        passages = []
+        for entry in entries:
+            passages.extend(split_into_passages(entry))
+
+        term_freqs = []
+        boost_terms = []
+        doc_freq = Counter()
+        lengths = []
+        for passage in passages:
+            tokens = tokenize(passage["text"])
+            tf = Counter(tokens)
+            term_freqs.append(tf)
+            lengths.append(len(tokens))
+            boost = set(tokenize(passage["title"] + " " + " ".join(passage["keywords"])))
+            boost_terms.append(boost)
+            doc_freq.update(set(tf) | boost)
+
+        digest = hashlib.sha1()
+        for entry in entries:
+            for field in ("category", "title", "description"):
+                digest.update(str(entry.get(field) or "").encode("utf-8") + b"\x00")
+            digest.update("\x00".join(entry.get("keywords") or []).encode("utf-8") + b"\x01")
+
+        self.passages = passages
+        self._term_freqs = term_freqs
+        self._boost_terms = boost_terms
+        self._doc_freq = doc_freq
+        self._lengths = lengths
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self.version = digest.hexdigest()[:12]
+
+    def __len__(self):
+        return len(self.passages)
+
+    def _idf(self, term: str) -> float:
+        n = len(self.passages)
+        df = self._doc_freq.get(term, 0)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query_tokens: list) -> list:
+        """Return a BM25 score per passage for the given query tokens."""
+        scores = [0.0] * len(self.passages)
+        if not query_tokens or not self.passages:
+            return scores
+
+        terms = set(query_tokens)
+        idfs = {t: self._idf(t) for t in terms}
+        for i, tf in enumerate(self._term_freqs):
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._avg_length or 1))
+            total = 0.0
+            for term in terms:
+                freq = tf.get(term, 0)
+                if freq:
+                    total += idfs[term] * freq * (BM25_K1 + 1) / (freq + length_norm)
+                if term in self._boost_terms[i]:
+                    total += idfs[term] * TITLE_BOOST
+            scores[i] = total
+        return scores
+
+    def search(self, query: str, max_chars: int = None, max_passages: int = None) -> list:
+        """
+        Select the best passages for a query, possibly from several entries,
+        without exceeding the context size budget.
+        """
+        max_chars = CONTEXT_MAX_CHARS if max_chars is None else max_chars
+        max_passages = CONTEXT_MAX_PASSAGES if max_passages is None else max_passages
+
+        scores = self.score(tokenize(query))
+        ranked = sorted(
+            (i for i, s in enumerate(scores) if s > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+
+        selected = []
+        used = 0
+        for i in ranked:
+            if len(selected) >= max_passages or scores[i] < scores[ranked[0]] * MIN_RELATIVE_SCORE:
+                break
+            passage = self.passages[i]
+            cost = len(passage["text"]) + len(passage["title"]) + 4
+            if used + cost > max_chars:
+                continue
+            selected.append(dict(passage, score=round(scores[i], 3)))
+            used += cost
+        return selected
+
+
+def format_context(passages: list) -> str:
+    """Render selected passages as the context block for the Gemini prompt."""
+    # Keep passages of the same entry together and in document order
+    order = []
+    grouped = {}
+    for passage in passages:
+        if passage["title"] not in grouped:
+            order.append(passage["title"])
+            grouped[passage["title"]] = []
+        grouped[passage["title"]].append(passage)
+
+    sections = []
+    for title in order:
+        parts = sorted(grouped[title], key=lambda p: p["position"])
+        sections.append(f"{title}:\n" + "\n\n".join(p["text"] for p in parts))
+    return "\n\n".join(sections)
+
+
+def fuzzy_scores(queries: list, rows: list) -> list:
+    """
+    SequenceMatcher ratio of every query against every row's title and
+    description. Each row's text is analysed once for all queries.
+    """
+    lowered = [q.lower() for q in queries]
+    scores = [[0.0] * len(rows) for _ in queries]
+    matcher = SequenceMatcher(None)
+    for j, item in enumerate(rows):
+        combined = f"{item.get('title','')} {item.get('description','')}".lower()
+        # SequenceMatcher caches its analysis of the second sequence
+        matcher.set_seq2(combined)
+        for i, query in enumerate(lowered):
+            matcher.set_seq1(query)
+            scores[i][j] = matcher.ratio()
+    return scores
+
+
+def fuzzy_match_batch(queries: list, rows: list) -> list:
+    """Best fuzzy match per query as {"match", "confidence"}, or None."""
+    results = []
+    for row_scores in fuzzy_scores(queries, rows):
+        best = max(range(len(rows)), key=row_scores.__getitem__, default=None)
+        if best is not None and row_scores[best] > FUZZY_MATCH_THRESHOLD:
+            results.append({"match": rows[best], "confidence": round(row_scores[best] * 100, 1)})
+        else:
+            results.append(None)
+    return results
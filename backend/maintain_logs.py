@@ -0,0 +1,259 @@
+"""
+Script to roll up, archive and prune old chatbot_logs rows
+
+For every whole day older than the retention window:
+1. stream the day's rows from chatbot_logs in batches,
+2. write them to a compressed archive file on local disk (gzip CSV, or
+   Parquet when pyarrow is installed and --format parquet is given),
+3. upsert per-category/source aggregates into chatbot_logs_daily,
+4. delete the day's rows in bounded chunks.
+
+A day's archive file is only moved into place once complete, and marks the
+day as rolled up: if a run stops half way through deleting, the next run
+skips straight to deleting the remaining rows instead of recomputing the
+aggregates from a partial day.
+
+The aggregate table must exist in Supabase (see --print-schema).
+
+Usage:
+    python maintain_logs.py [--retention-days 30] [--archive-dir log_archive] [--dry-run]
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import os
+
+from supabase_client import supabase
+
+try:
+    import pyarrow  # type: ignore
+    import pyarrow.parquet  # type: ignore
+except ImportError:
+    pyarrow = None
+
+LOG_COLUMNS = ["id", "created_at", "user_query", "bot_response", "matched_category", "source"]
+
+DAILY_SCHEMA = """
+create table if not exists chatbot_logs_daily (
+    day date not null,
+    matched_category text not null,
+    source text not null,
+    chats integer not null,
+    avg_query_chars real not null,
+    avg_response_chars real not null,
+    primary key (day, matched_category, source)
+);
+"""
+
+# chatbot_logs_daily key columns cannot be null
+NO_VALUE = "none"
+
+DEFAULT_ARCHIVE_DIR = os.getenv(
+    "LOG_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_archive"),
+)
+
+
+def _day_bounds(day: datetime.date):
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start.isoformat(), (start + datetime.timedelta(days=1)).isoformat()
+
+
+def iter_day_rows(day: datetime.date, batch_size: int, columns=LOG_COLUMNS):
+    """Yield the day's chatbot_logs rows in id order, one batch at a time."""
+    start, end = _day_bounds(day)
+    last_id = None
+    while True:
+        query = (supabase.table("chatbot_logs").select(",".join(columns))
+                 .gte("created_at", start).lt("created_at", end))
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(batch_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if len(rows) < batch_size:
+            return
+
+
+def next_log_day(after: datetime.date = None):
+    """First day with chatbot_logs rows, optionally after the given day."""
+    query = supabase.table("chatbot_logs").select("created_at")
+    if after is not None:
+        query = query.gte("created_at", _day_bounds(after)[1])
+    response = query.order("created_at").limit(1).execute()
+    if not response.data:
+        return None
+    return datetime.date.fromisoformat(response.data[0]["created_at"][:10])
+
+
+class DailyRollup:
+    """Per (category, source) counters for one day."""
+
+    def __init__(self, day: datetime.date):
+        self.day = day
+        self.groups = {}
+
+    def add(self, rows: list):
+        for row in rows:
+            key = (row.get("matched_category") or NO_VALUE, row.get("source") or NO_VALUE)
+            group = self.groups.setdefault(key, [0, 0, 0])
+            group[0] += 1
+            group[1] += len(row.get("user_query") or "")
+            group[2] += len(row.get("bot_response") or "")
+
+    def records(self) -> list:
+        return [
+            {
+                "day": self.day.isoformat(),
+                "matched_category": category,
+                "source": source,
+                "chats": chats,
+                "avg_query_chars": round(query_chars / chats, 1),
+                "avg_response_chars": round(response_chars / chats, 1),
+            }
+            for (category, source), (chats, query_chars, response_chars) in sorted(self.groups.items())
+        ]
+
+
+class _CSVArchive:
+    extension = ".csv.gz"
+
+    def __init__(self, path: str):
+        self.file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=LOG_COLUMNS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, rows: list):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetArchive:
+    extension = ".parquet"
+
+    def __init__(self, path: str):
+        schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("created_at", pyarrow.string()),
+            ("user_query", pyarrow.string()),
+            ("bot_response", pyarrow.string()),
+            ("matched_category", pyarrow.string()),
+            ("source", pyarrow.string()),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, schema, compression="zstd")
+        self.schema = schema
+
+    def write(self, rows: list):
+        columns = {name: [row.get(name) for row in rows] for name in LOG_COLUMNS}
+        self.writer.write_table(pyarrow.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def archive_path(archive_dir: str, day: datetime.date, fmt: str) -> str:
+    extension = _ParquetArchive.extension if fmt == "parquet" else _CSVArchive.extension
+    return os.path.join(archive_dir, f"{day:%Y}", f"chatbot_logs_{day.isoformat()}{extension}")
+
+
+def archive_and_roll_up(day: datetime.date, path: str, fmt: str, batch_size: int) -> DailyRollup:
+    """Stream the day's rows into the archive file and aggregate them."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".partial"
+    archive = _ParquetArchive(partial) if fmt == "parquet" else _CSVArchive(partial)
+    rollup = DailyRollup(day)
+    try:
+        for rows in iter_day_rows(day, batch_size):
+            archive.write(rows)
+            rollup.add(rows)
+    finally:
+        archive.close()
+    if not rollup.groups:
+        os.remove(partial)
+        return rollup
+    supabase.table("chatbot_logs_daily").upsert(
+        rollup.records(), on_conflict="day,matched_category,source").execute()
+    # The complete archive marks the day as rolled up
+    os.replace(partial, path)
+    return rollup
+
+
+def delete_day(day: datetime.date, batch_size: int, delete_chunk: int) -> int:
+    """Delete the day's rows in bounded chunks; returns the number deleted."""
+    deleted = 0
+    while True:
+        batch = next(iter_day_rows(day, batch_size, ["id"]), [])
+        if not batch:
+            return deleted
+        ids = [row["id"] for row in batch]
+        removed = 0
+        for i in range(0, len(ids), delete_chunk):
+            response = supabase.table("chatbot_logs").delete().in_("id", ids[i:i + delete_chunk]).execute()
+            removed += len(response.data or [])
+        if removed == 0:
+            # e.g. row level security blocking deletes with the anon key: the
+            # same rows would be fetched again forever
+            raise RuntimeError(f"{day}: no rows deleted; check that SUPABASE_KEY may delete from chatbot_logs")
+        deleted += removed
+
+
+def maintain_logs(retention_days: int, archive_dir: str, fmt: str, batch_size: int,
+                  delete_chunk: int, dry_run: bool):
+    if supabase is None:
+        print("Supabase not configured. Please set SUPABASE_URL and SUPABASE_KEY in .env file")
+        return
+    if fmt == "parquet" and pyarrow is None:
+        print("Parquet archives need pyarrow (pip install pyarrow); use --format csv")
+        return
+
+    cutoff = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=retention_days)
+    day = next_log_day()
+    if day is None or day >= cutoff:
+        print(f"No chatbot_logs rows older than {cutoff.isoformat()}")
+        return
+
+    while day is not None and day < cutoff:
+        path = archive_path(archive_dir, day, fmt)
+        if dry_run:
+            count = sum(len(rows) for rows in iter_day_rows(day, batch_size, ["id"]))
+            if count:
+                print(f"{day}: would archive, roll up and delete {count} rows")
+        else:
+            if os.path.exists(path):
+                print(f"{day}: already archived, finishing deletion")
+            else:
+                rollup = archive_and_roll_up(day, path, fmt, batch_size)
+                chats = sum(r["chats"] for r in rollup.records())
+                print(f"{day}: archived {chats} rows to {path}")
+            try:
+                deleted = delete_day(day, batch_size, delete_chunk)
+            except RuntimeError as e:
+                print(f"Error deleting rows: {e}")
+                return
+            print(f"{day}: deleted {deleted} rows")
+        day = next_log_day(day)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up, archive and prune old chatbot_logs rows")
+    parser.add_argument("--retention-days", type=int, default=int(os.getenv("LOG_RETENTION_DAYS", 30)),
+                        help="keep raw rows for this many days")
+    parser.add_argument("--archive-dir", default=DEFAULT_ARCHIVE_DIR)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="archive format (parquet requires pyarrow)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows fetched per request")
+    parser.add_argument("--delete-chunk", type=int, default=200, help="rows deleted per request")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be done")
+    parser.add_argument("--print-schema", action="store_true", help="print the chatbot_logs_daily DDL and exit")
+    args = parser.parse_args()
+
+    if args.print_schema:
+        print(DAILY_SCHEMA.strip())
+    else:
+        maintain_logs(args.retention_days, args.archive_dir, args.format, args.batch_size,
+                      args.delete_chunk, args.dry_run)
@@ -0,0 +1,164 @@
+"""
+Script to precompute answers for every chatbot_knowledge entry
+
+Generates canonical question variants per entry (title, "What is ...?",
+category-specific phrasings, keywords), answers them through the same
+retrieval + Gemini pipeline as /chat with bounded concurrency and rate
+limiting, and writes the answers to the persistent answer store that app.py
+loads into its answer cache at startup.
+
+Runs incrementally: only entries whose content hash changed since the last
+run (or that are new) are regenerated; answers of deleted entries are removed.
+
+Usage:
+    python precompute_answers.py [--concurrency 4] [--rate 2] [--force]
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import TokenBucketLimiter
+from answer_store import ANSWER_STORE_PATH, AnswerStore, entry_hash
+
+CATEGORY_QUESTIONS = {
+    "About": [
+        "Who are you?",
+        "What is YVI Technologies?",
+        "Tell me about your company",
+    ],
+    "Contact": [
+        "How can I contact you?",
+        "What is your email address?",
+        "What is your phone number?",
+        "Where are you located?",
+    ],
+    "Services": [
+        "What {title} services do you offer?",
+        "Do you provide {title}?",
+    ],
+    "Core Capabilities": [
+        "What {title} solutions do you offer?",
+        "What modules does {title} include?",
+    ],
+    "Other Capabilities": [
+        "What {title} services do you offer?",
+        "Do you provide {title}?",
+    ],
+    "Process": [
+        "What happens during {title}?",
+        "How do you handle {title}?",
+    ],
+}
+
+
+def question_variants(entry: dict, max_keywords: int = 2, shared_keywords=frozenset()) -> list:
+    """
+    Canonical questions users ask about one KB entry. Keywords in
+    shared_keywords belong to several entries ("oracle", "development") and do
+    not make a question about this one.
+    """
+    title = entry["title"]
+    questions = [
+        title,
+        f"What is {title}?",
+        f"Tell me about {title}",
+    ]
+    for template in CATEGORY_QUESTIONS.get(entry.get("category"), []):
+        questions.append(template.format(title=title))
+    keywords = [k for k in entry.get("keywords") or [] if k.lower() not in shared_keywords]
+    for keyword in keywords[:max_keywords]:
+        if keyword.lower() != title.lower():
+            questions.append(f"Tell me about {keyword}")
+    # Preserve order, drop duplicates
+    return list(dict.fromkeys(questions))
+
+
+def wait_for_token(limiter: TokenBucketLimiter):
+    while True:
+        retry_after = limiter.acquire("gemini")
+        if retry_after <= 0:
+            return
+        time.sleep(retry_after)
+
+
+def precompute(concurrency: int, rate: float, force: bool, store_path: str):
+    # Importing app loads the knowledge base and builds the same indexes /chat uses
+    import app
+
+    if not app.knowledge_entries:
+        print("No knowledge base entries loaded. Check SUPABASE_URL and SUPABASE_KEY in .env file")
+        return
+
+    store = AnswerStore(store_path)
+    stored_hashes = store.entry_hashes()
+    current = {entry["title"]: entry for entry in app.knowledge_entries}
+
+    removed = [title for title in stored_hashes if title not in current]
+    if removed:
+        store.remove_entries(removed)
+        print(f"Removed answers for {len(removed)} deleted entries")
+
+    todo = [
+        entry for title, entry in current.items()
+        if force or stored_hashes.get(title) != entry_hash(entry)
+    ]
+    print(f"{len(todo)} of {len(current)} entries need answers ({len(current) - len(todo)} unchanged)")
+    if not todo:
+        store.close()
+        return
+
+    keyword_counts = Counter(
+        keyword for entry in current.values() for keyword in {k.lower() for k in entry.get("keywords") or []})
+    shared_keywords = {keyword for keyword, count in keyword_counts.items() if count > 1}
+    questions_by_title = {
+        entry["title"]: question_variants(entry, shared_keywords=shared_keywords) for entry in todo}
+    # Entries can still ask the same question ("Who are you?"); answer it once
+    questions = list(dict.fromkeys(q for variants in questions_by_title.values() for q in variants))
+    search_queries = [app.query_normalizer.normalize(question) for question in questions]
+    search_results = app.search_database_batch(search_queries)
+
+    limiter = TokenBucketLimiter(rate, max(1.0, rate))
+
+    def answer(i):
+        question = questions[i]
+        wait_for_token(limiter)
+        try:
+            reply, source = app.build_answer(question, search_results[i], search_queries[i])
+            return reply, source
+        except Exception as e:
+            print(f"Failed to answer {question!r}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        answers = dict(zip(questions, executor.map(answer, range(len(questions)))))
+
+    answers_by_title = {}
+    failed_titles = set()
+    for title, variants in questions_by_title.items():
+        for question in variants:
+            if answers[question] is None:
+                failed_titles.add(title)
+            else:
+                answers_by_title.setdefault(title, []).append((question, *answers[question]))
+
+    for entry in todo:
+        title = entry["title"]
+        if title in failed_titles:
+            # Keep the previous answers; the entry is retried on the next run
+            continue
+        store.replace_entry(title, entry_hash(entry), answers_by_title.get(title, []))
+
+    store.close()
+    print(f"Stored answers for {len(todo) - len(failed_titles)} entries in {store_path}"
+          + (f"; {len(failed_titles)} entries failed and will be retried" if failed_titles else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute answers for every knowledge base entry")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel Gemini calls")
+    parser.add_argument("--rate", type=float, default=2.0, help="Gemini calls per second")
+    parser.add_argument("--force", action="store_true", help="regenerate all entries")
+    parser.add_argument("--store", default=ANSWER_STORE_PATH, help="answer store file")
+    args = parser.parse_args()
+    precompute(args.concurrency, args.rate, args.force, args.store)
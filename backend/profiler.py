@@ -0,0 +1,207 @@
+"""
+On-demand sampling profiler and slow-request capture.
+
+A single background thread samples the Python stacks of in-flight requests
+(via sys._current_frames) while there is something to watch:
+
+- a sampled fraction of requests, when profiling is switched on, and
+- any request that has been running longer than the slow threshold.
+
+Samples are aggregated into collapsed stacks ("a;b;c 42"), the input format
+of flamegraph.pl / speedscope. Slow requests additionally keep their own
+stacks and the stage timings of their trace in a small ring buffer.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+from flask import request  # type: ignore
+
+from tracing import current_trace
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = float(os.getenv("PROFILER_INTERVAL_MS", 10)) / 1000
+
+# Requests slower than this are captured even when profiling is off
+SLOW_REQUEST_SECONDS = float(os.getenv("PROFILER_SLOW_SECONDS", 5))
+
+# Number of slow requests kept for download
+SLOW_REQUEST_HISTORY = int(os.getenv("PROFILER_SLOW_HISTORY", 50))
+
+# Cap on distinct collapsed stacks, to bound memory when left on
+MAX_DISTINCT_STACKS = 20000
+
+# Stack depth kept per sample
+MAX_STACK_DEPTH = 64
+
+
+def _collapse(frame) -> str:
+    """Render a frame chain root-first as a collapsed stack."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _RequestRecord:
+    __slots__ = ("thread_id", "name", "started", "sampled", "stacks")
+
+    def __init__(self, thread_id: int, name: str, sampled: bool):
+        self.thread_id = thread_id
+        self.name = name
+        self.started = time.monotonic()
+        self.sampled = sampled
+        self.stacks = Counter()
+
+
+class Profiler:
+    """Process-wide profiler; see the module docstring."""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_threshold = SLOW_REQUEST_SECONDS
+        self.stacks = Counter()
+        self.slow_requests = deque(maxlen=SLOW_REQUEST_HISTORY)
+        self.profiled_requests = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def configure(self, enabled=None, sample_rate=None, slow_threshold=None):
+        with self._lock:
+            if enabled is not None:
+                if not isinstance(enabled, bool):
+                    raise TypeError("enabled must be true or false")
+                self.enabled = enabled
+            if sample_rate is not None:
+                self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+            if slow_threshold is not None:
+                self.slow_threshold = max(0.0, float(slow_threshold))
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.slow_requests.clear()
+            self.profiled_requests = 0
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_threshold": self.slow_threshold,
+            "interval_ms": SAMPLE_INTERVAL * 1000,
+            "profiled_requests": self.profiled_requests,
+            "distinct_stacks": len(self.stacks),
+            "samples": sum(self.stacks.values()),
+            "slow_requests": len(self.slow_requests),
+            "in_flight": len(self._active),
+        }
+
+    # Request lifecycle -------------------------------------------------
+
+    def begin(self, name: str) -> _RequestRecord:
+        sampled = self.enabled and random.random() < self.sample_rate
+        record = _RequestRecord(threading.get_ident(), name, sampled)
+        with self._lock:
+            self._active[record.thread_id] = record
+            self._ensure_thread()
+        self._wakeup.set()
+        return record
+
+    def end(self, record: _RequestRecord, stages=None):
+        duration = time.monotonic() - record.started
+        with self._lock:
+            self._active.pop(record.thread_id, None)
+            if record.sampled:
+                self.profiled_requests += 1
+            if duration >= self.slow_threshold:
+                self.slow_requests.append({
+                    "name": record.name,
+                    "started_at": time.time() - duration,
+                    "duration_ms": round(duration * 1000, 1),
+                    "stages": stages or [],
+                    "stacks": dict(record.stacks.most_common(50)),
+                })
+
+    # Sampling ----------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._next_delay()
+            if delay is None:
+                self._wakeup.wait()
+                continue
+            if delay > SAMPLE_INTERVAL:
+                # Nothing to sample until a request turns slow (or a new one arrives)
+                self._wakeup.wait(delay)
+                continue
+            time.sleep(SAMPLE_INTERVAL)
+            self._sample()
+
+    def _next_delay(self):
+        """Seconds until some in-flight request needs sampling, None if idle."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._active:
+                return None
+            if any(r.sampled for r in self._active.values()):
+                return 0.0
+            oldest = min(r.started for r in self._active.values())
+        return max(0.0, oldest + self.slow_threshold - now)
+
+    def _sample(self):
+        now = time.monotonic()
+        with self._lock:
+            watched = [
+                r for r in self._active.values()
+                if r.sampled or now - r.started >= self.slow_threshold
+            ]
+        if not watched:
+            return
+
+        frames = sys._current_frames()
+        with self._lock:
+            for record in watched:
+                frame = frames.get(record.thread_id)
+                if frame is None:
+                    continue
+                stack = f"{record.name};{_collapse(frame)}"
+                if now - record.started >= self.slow_threshold:
+                    record.stacks[stack] += 1
+                if record.sampled and (stack in self.stacks or len(self.stacks) < MAX_DISTINCT_STACKS):
+                    self.stacks[stack] += 1
+
+    def collapsed(self) -> str:
+        """Aggregated samples in collapsed-stack format."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+profiler = Profiler()
+
+
+def profiled(view):
+    """Route decorator registering the request with the profiler."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        record = profiler.begin(f"{request.method} {request.path}")
+        try:
+            return view(*args, **kwargs)
+        finally:
+            trace = current_trace()
+            profiler.end(record, trace.stages() if trace else None)
+    return wrapper
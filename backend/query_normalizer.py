@@ -0,0 +1,180 @@
+"""
+Query normalization and spelling correction.
+
+Queries are casefolded, split into words of any script, spell-corrected toward
+the terms of knowledge base titles and keywords (symmetric-delete / SymSpell
+style) and rewritten with the synonyms table before retrieval, so that
+"Oracel HCM?" finds the Oracle HCM entry instead of falling through to an
+AI-only answer.
+"""
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+from knowledge_index import STOPWORDS, stem
+
+# Maximum edit distance for spelling correction
+MAX_EDIT_DISTANCE = 2
+
+# Words shorter than this are corrected by at most one edit ("course" must not
+# become "core", nor "prices" "process")
+MIN_LENGTH_FOR_TWO_EDITS = 8
+
+# With several candidates at the best distance, the most frequent one must be
+# this many times as frequent as the next, or the word is left alone
+MIN_FREQUENCY_RATIO = 2
+
+# Words shorter than this are never corrected ("ai", "qa", "ux", ...)
+MIN_CORRECTION_LENGTH = 4
+
+# Number of normalized queries remembered per index version
+QUERY_CACHE_SIZE = 4096
+
+# Everyday chat words that are not in the knowledge base but must never be
+# "corrected" into one of its terms ("there" -> "these")
+COMMON_WORDS = {
+    "hello", "hey", "there", "thanks", "thank", "please", "help", "know", "want",
+    "need", "give", "like", "could", "would", "should", "where", "when", "who",
+    "why", "this", "that", "have", "has", "more", "some", "any", "much", "many",
+    "good", "great", "okay", "sure", "price", "pricing", "cost", "costs", "work",
+    "works", "company", "today", "name", "they", "them", "their", "just",
+}
+
+
+def words(text: str) -> list:
+    """
+    Casefolded words of any script. Letters, combining marks (Devanagari vowel
+    signs, ...) and digits are kept; everything else separates words.
+    """
+    return "".join(
+        char if unicodedata.category(char)[0] in "LMN" else " " for char in text.casefold()
+    ).split()
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    """All strings obtained by deleting up to max_distance characters."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def _squeeze(word: str) -> str:
+    """Collapse runs of the same letter ("helllo" -> "helo")."""
+    return re.sub(r"(.)\1+", r"\1", word)
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance."""
+    if a == b:
+        return 0
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+
+class QueryNormalizer:
+    """
+    Normalization pipeline built once per knowledge base version.
+    `normalize()` is memoized, so repeated questions cost a dict lookup.
+    """
+
+    def __init__(self, entries=None, synonyms=None, version=None):
+        self.version = version
+        self.vocabulary = Counter()
+        self._stems = set()
+        # Words a misspelling may be corrected to
+        self._targets = set()
+        self._delete_index = {}
+        self._synonym_patterns = []
+
+        for entry in entries or []:
+            # Titles and keywords are what users ask about, so weight them up
+            heading = entry.get("title", "") + " " + " ".join(entry.get("keywords") or [])
+            for word in words(heading):
+                self.vocabulary[word] += 5
+                self._targets.add(word)
+            for word in words(entry.get("description") or ""):
+                self.vocabulary[word] += 1
+        for phrase in list((synonyms or {}).keys()) + list((synonyms or {}).values()):
+            for word in words(phrase):
+                self.vocabulary[word] += 1
+                self._targets.add(word)
+
+        self._stems = {stem(word) for word in self.vocabulary}
+        # Description-only words are too generic to correct toward: an unknown
+        # word would be rewritten into an unrelated one ("resume" -> "reduce")
+        for word in self._targets:
+            if len(word) < MIN_CORRECTION_LENGTH or word.isdigit():
+                continue
+            for deleted in _deletes(word, self._max_distance(word)):
+                self._delete_index.setdefault(deleted, []).append(word)
+
+        # Longest phrases first so "mobile app development" wins over shorter ones
+        for source, target in sorted((synonyms or {}).items(), key=lambda kv: -len(kv[0])):
+            pattern = re.compile(r"\b" + re.escape(source.casefold()) + r"\b")
+            self._synonym_patterns.append((pattern, target.casefold()))
+
+        self.normalize = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._normalize)
+
+    @staticmethod
+    def _max_distance(word: str) -> int:
+        return 1 if len(word) < MIN_LENGTH_FOR_TWO_EDITS else MAX_EDIT_DISTANCE
+
+    def is_known(self, word: str) -> bool:
+        return word in self.vocabulary or stem(word) in self._stems
+
+    def correct(self, word: str) -> str:
+        """
+        Closest title/keyword term within the edit distance, else the word
+        itself. Corrections never drop letters other than a doubled one
+        ("contract" is not "contact", "contactt" is) and ambiguous ones are
+        skipped.
+        """
+        if (self.is_known(word) or word in STOPWORDS or word in COMMON_WORDS or word.isdigit()
+                or len(word) < MIN_CORRECTION_LENGTH):
+            return word
+
+        max_distance = self._max_distance(word)
+        candidates = []
+        seen = set()
+        for deleted in _deletes(word, max_distance):
+            for candidate in self._delete_index.get(deleted, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if len(candidate) < len(word) and _squeeze(candidate) != _squeeze(word):
+                    continue
+                distance = edit_distance(word, candidate)
+                if distance <= max_distance:
+                    candidates.append((distance, -self.vocabulary[candidate], candidate))
+        if not candidates:
+            return word
+
+        candidates.sort()
+        distance, negative_frequency, best = candidates[0]
+        if (len(candidates) > 1 and candidates[1][0] == distance
+                and -negative_frequency < MIN_FREQUENCY_RATIO * -candidates[1][1]):
+            return word
+        return best
+
+    def _normalize(self, query: str) -> str:
+        text = " ".join(self.correct(word) for word in words(query))
+        for pattern, target in self._synonym_patterns:
+            text = pattern.sub(target, text)
+        return text
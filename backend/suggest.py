@@ -0,0 +1,104 @@
+"""
+Typeahead suggestions over knowledge base titles and keywords.
+
+Every prefix (up to MAX_PREFIX_LENGTH characters) of every title, title word
+and keyword is mapped at build time to its top suggestions, so a lookup is a
+single dict access. Longer prefixes fall back to a binary search over the
+sorted terms. Suggestions are ranked by how the prefix matched (full title,
+word in the title, keyword) and by how often their category was matched in
+chatbot_logs.
+"""
+import bisect
+import math
+import re
+import time
+
+# Prefixes longer than this are answered from the sorted term list
+MAX_PREFIX_LENGTH = 24
+
+MAX_SUGGESTIONS = 8
+
+# Score for a prefix of the whole title, of a word in it, or of a keyword
+MATCH_WEIGHTS = {"title": 3.0, "word": 2.0, "keyword": 1.0}
+
+# Weight of log(1 + times the entry's category was matched)
+POPULARITY_WEIGHT = 0.5
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9&/+ ]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_prefix(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace (keeps a trailing space)."""
+    text = _NON_WORD_RE.sub(" ", text.lower())
+    return _SPACES_RE.sub(" ", text).lstrip()
+
+
+class SuggestionIndex:
+    """Precomputed prefix -> top suggestions table; see the module docstring."""
+
+    def __init__(self, entries=None, popularity=None, max_results: int = MAX_SUGGESTIONS):
+        self.max_results = max_results
+        self.built_at = time.time()
+        self.suggestions = []
+        self._terms = []
+        self._table = {}
+
+        popularity = popularity or {}
+        scored_terms = []
+        for entry in entries or []:
+            title = entry.get("title") or ""
+            if not title:
+                continue
+            category = entry.get("category")
+            index = len(self.suggestions)
+            self.suggestions.append({"text": title, "category": category})
+            boost = POPULARITY_WEIGHT * math.log1p(popularity.get(category, 0))
+
+            normalized_title = normalize_prefix(title).strip()
+            words = normalized_title.split(" ")
+            terms = {normalized_title: "title"}
+            for i in range(1, len(words)):
+                terms.setdefault(" ".join(words[i:]), "word")
+            for keyword in entry.get("keywords") or []:
+                terms.setdefault(normalize_prefix(keyword).strip(), "keyword")
+
+            for term, match in terms.items():
+                if term:
+                    scored_terms.append((term, index, MATCH_WEIGHTS[match] + boost, match))
+
+        # Best score per suggestion for each prefix
+        best = {}
+        for term, index, score, match in scored_terms:
+            for length in range(0, min(len(term), MAX_PREFIX_LENGTH) + 1):
+                bucket = best.setdefault(term[:length], {})
+                if score > bucket.get(index, (0.0, None))[0]:
+                    bucket[index] = (score, match)
+        for prefix, bucket in best.items():
+            ranked = sorted(bucket.items(), key=lambda item: (-item[1][0], self.suggestions[item[0]]["text"]))
+            self._table[prefix] = [(index, match) for index, (_, match) in ranked[:max_results]]
+
+        self._terms = sorted(
+            (term, -score, index, match) for term, index, score, match in scored_terms)
+        self._term_keys = [t[0] for t in self._terms]
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def lookup(self, query: str) -> list:
+        prefix = normalize_prefix(query)
+        hits = self._table.get(prefix)
+        if hits is None:
+            hits = self._lookup_long(prefix) if len(prefix) > MAX_PREFIX_LENGTH else []
+        return [dict(self.suggestions[index], match=match) for index, match in hits]
+
+    def _lookup_long(self, prefix: str) -> list:
+        start = bisect.bisect_left(self._term_keys, prefix)
+        seen = {}
+        for term, negative_score, index, match in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            if index not in seen or -negative_score > seen[index][0]:
+                seen[index] = (-negative_score, match)
+        ranked = sorted(seen.items(), key=lambda item: -item[1][0])
+        return [(index, match) for index, (_, match) in ranked[:self.max_results]]
@@ -1,3 +1,4 @@
+import logging
 import os
 
 # Handle potential import issues gracefully
@@ -13,6 +14,8 @@ except ImportError:
     def load_dotenv():
         pass
 
+from tracing import log_event
+
 # Load environment variables
 load_dotenv()
 
@@ -91,6 +94,35 @@ def get_category_entries(category: str) -> list:
         print(f"Error fetching category entries: {e}")
         return []
 
+def get_category_popularity(recent_limit: int = 5000) -> dict:
+    """
+    Count how often each category was matched, from the daily rollups and
+    the most recent chatbot_logs rows
+    """
+    counts = {}
+    # Return empty counts if Supabase is not configured
+    if supabase is None:
+        return counts
+        
+    try:
+        response = supabase.table("chatbot_logs").select("matched_category").order("created_at", desc=True).limit(recent_limit).execute()
+        for item in response.data or []:
+            category = item.get("matched_category")
+            if category:
+                counts[category] = counts.get(category, 0) + 1
+    except Exception as e:
+        log_event(logging.ERROR, "Error fetching category popularity", error=str(e))
+    try:
+        response = supabase.table("chatbot_logs_daily").select("matched_category,chats").execute()
+        for item in response.data or []:
+            category = item.get("matched_category")
+            if category:
+                counts[category] = counts.get(category, 0) + (item.get("chats") or 0)
+    except Exception:
+        # The rollup table only exists once maintain_logs.py has been set up
+        pass
+    return counts
+
 def log_chat_interaction(user_query: str, bot_response: str, matched_category = None, source = None):
     """
     Log chat interactions for analytics
@@ -106,11 +138,21 @@ def log_chat_interaction(user_query: str, bot_response: str, matched_category =
             "matched_category": matched_category,
             "source": source
         }).execute()
-        print(f"Successfully logged interaction: {user_query}")  # Added for debugging
     except Exception as e:
-        print(f"Error logging chat interaction: {e}")
-        import traceback
-        traceback.print_exc()  # Added for better error diagnostics
+        log_event(logging.ERROR, "Error logging chat interaction", error=str(e))
+
+def log_chat_interactions(rows: list):
+    """
+    Log several chat interactions with a single bulk insert
+    """
+    # Return if Supabase is not configured
+    if supabase is None or not rows:
+        return
+        
+    try:
+        supabase.table("chatbot_logs").insert(rows).execute()
+    except Exception as e:
+        log_event(logging.ERROR, "Error logging chat interactions", error=str(e), rows=len(rows))
 
 def initialize_knowledge_base():
     """
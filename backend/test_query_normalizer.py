@@ -0,0 +1,51 @@
+import os
+import sys
+
+# Add the current directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from initialize_supabase import create_sample_knowledge_data
+from query_normalizer import QueryNormalizer
+
+# Misspellings that must be corrected toward the knowledge base
+CORRECTED = {
+    "Oracel HCM?": "oracle hcm",
+    "cybersecurty": "cybersecurity",
+    "develpment": "development",
+    "contactt": "contact",
+}
+
+# Ordinary words that must not be rewritten into knowledge base terms
+UNCHANGED = [
+    "what are your prices",
+    "what are your processes",
+    "contract",
+    "contracts",
+    "course",
+    "send resume",
+    "qué servicios ofrecen",
+    "oracle hcm के बारे में बताएं",
+]
+
+
+def _normalizer():
+    return QueryNormalizer(create_sample_knowledge_data(), {}, "test")
+
+
+def test_corrects_misspellings():
+    normalizer = _normalizer()
+    for query, expected in CORRECTED.items():
+        assert normalizer.normalize(query) == expected, query
+
+
+def test_leaves_ordinary_words_alone():
+    normalizer = _normalizer()
+    for query in UNCHANGED:
+        assert normalizer.normalize(query) == query, query
+
+
+if __name__ == "__main__":
+    print("Testing query normalization...")
+    test_corrects_misspellings()
+    test_leaves_ordinary_words_alone()
+    print("Test completed")
@@ -0,0 +1,229 @@
+"""
+Lightweight per-request tracing and structured diagnostics.
+
+Every traced request gets a request ID (taken from X-Request-Id when the
+caller sends one) and records spans for its stages (normalize, search,
+prompt_build, gemini, post_process, log) with durations and attributes.
+Finished traces and diagnostic events are written as one JSON object per line
+through a bounded in-memory queue drained by a background thread, so the
+request path never blocks on stdout.
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import request, make_response  # type: ignore
+
+# Fraction of traces emitted; slow and failed requests are always emitted
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 2000))
+
+# Records waiting to be written; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record):
+        # The message is already a JSON string; skip QueueHandler's formatting
+        return record
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            payload = {
+                "type": "event",
+                "ts": round(record.created, 3),
+                "level": record.levelname.lower(),
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            fields = getattr(record, "fields", None)
+            if fields:
+                payload.update(fields)
+            if record.exc_info:
+                payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_stream_handler = logging.StreamHandler(sys.stdout)
+_stream_handler.setFormatter(_JSONFormatter())
+_listener = logging.handlers.QueueListener(_log_queue, _stream_handler, respect_handler_level=False)
+_listener.start()
+
+_queue_handler = _DroppingQueueHandler(_log_queue)
+
+logger = logging.getLogger("yvi")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+logger.addHandler(_queue_handler)
+
+# Traces have their own logger so LOG_LEVEL does not silence them
+trace_logger = logging.getLogger("yvi.trace")
+trace_logger.setLevel(logging.INFO)
+trace_logger.propagate = False
+trace_logger.addHandler(_queue_handler)
+
+
+def log_event(level: int, message: str, exc_info=None, **fields):
+    """Write a structured diagnostic event tagged with the current request ID."""
+    if not logger.isEnabledFor(level):
+        return
+    trace = _current_trace.get()
+    if trace is not None and not trace.finished:
+        fields.setdefault("request_id", trace.request_id)
+    logger.log(level, message, exc_info=exc_info, extra={"fields": fields})
+
+
+class Trace:
+    """Spans recorded for one request."""
+
+    def __init__(self, name: str, request_id: str = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.sampled = random.random() < TRACE_SAMPLE_RATE
+        self.spans = []
+        self.attributes = {}
+        self.error = False
+        self.finished = False
+        # itertools.count is safe to share with batch worker threads
+        self._span_ids = itertools.count(1)
+
+    def _span_id(self) -> int:
+        return next(self._span_ids)
+
+    def stages(self) -> list:
+        """Span timings in the compact form used by the profiler."""
+        return [
+            {"stage": s["name"], "offset_ms": s["offset_ms"], "duration_ms": s["duration_ms"]}
+            for s in self.spans
+        ]
+
+    def finish(self, status: int = None):
+        if self.finished:
+            return
+        self.finished = True
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        if status is not None:
+            self.attributes["status"] = status
+            self.error = self.error or status >= 500
+        if not (self.sampled or self.error or duration_ms >= TRACE_SLOW_MS):
+            return
+        payload = {
+            "type": "trace",
+            "ts": round(self.started_at, 3),
+            "request_id": self.request_id,
+            "name": self.name,
+            "duration_ms": round(duration_ms, 2),
+            "error": self.error,
+            "attributes": self.attributes,
+            "spans": sorted(self.spans, key=lambda s: s["offset_ms"]),
+        }
+        trace_logger.info("trace", extra={"payload": payload})
+
+
+def current_trace():
+    trace = _current_trace.get()
+    return trace if trace is not None and not trace.finished else None
+
+
+def current_request_id():
+    trace = current_trace()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a span on the current trace. Yields the attribute dict so callers
+    can add attributes discovered while the span runs. No-op without a trace.
+    """
+    trace = current_trace()
+    if trace is None:
+        yield attributes
+        return
+
+    span_id = trace._span_id()
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        trace.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        record = {
+            "id": span_id,
+            "parent": parent,
+            "name": name,
+            "offset_ms": round((started - trace.started) * 1000, 2),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        if attributes:
+            record["attributes"] = attributes
+        if error:
+            record["error"] = error
+        trace.spans.append(record)
+
+
+def traced(view):
+    """
+    Route decorator starting a trace for the request and returning its ID in
+    the X-Request-Id response header.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        incoming_id = request.headers.get("X-Request-Id", "")
+        request_id = incoming_id if _REQUEST_ID_RE.match(incoming_id) else None
+        trace = Trace(f"{request.method} {request.path}", request_id)
+        _current_trace.set(trace)
+        _current_span.set(None)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            trace.error = True
+            trace.finish(500)
+            raise
+        response.headers["X-Request-Id"] = trace.request_id
+        if response.is_streamed:
+            response.call_on_close(lambda: trace.finish(response.status_code))
+        else:
+            trace.finish(response.status_code)
+        return response
+    return wrapper